@@ -18,27 +18,68 @@ class ConfigManager:
             base_path = os.path.dirname(os.path.abspath(__file__))
         self.config_path = os.path.join(base_path, 'config.txt')
 
-    def load_db_path(self):
-        """Loads the database path from the config file."""
+    def _read_lines(self):
+        """Reads the config file: line 1 is the DB path, line 2 the max session hours."""
         try:
             with open(self.config_path, 'r') as f:
-                path = f.readline().strip()
-                if path and os.path.exists(path):
-                    return path
+                lines = [line.strip() for line in f.readlines()]
         except FileNotFoundError:
-            return None  # Config file doesn't exist yet
+            lines = []  # Config file doesn't exist yet
+        return (lines + ['', ''])[:2]
+
+    def _write_lines(self, lines):
+        with open(self.config_path, 'w') as f:
+            f.write('\n'.join(lines))
+
+    def load_db_path(self):
+        """Loads the database path from the config file."""
+        path = self._read_lines()[0]
+        if path and os.path.exists(path):
+            return path
         return None
 
     def save_db_path(self, path):
         """Saves the given database path to the config file."""
-        with open(self.config_path, 'w') as f:
-            f.write(path)
+        lines = self._read_lines()
+        lines[0] = path
+        self._write_lines(lines)
+
+    def load_max_session_hours(self):
+        """Loads the session length (hours) above which a day is flagged as anomalous."""
+        try:
+            hours = float(self._read_lines()[1])
+        except ValueError:
+            return DatabaseManager.DEFAULT_MAX_SESSION_HOURS
+        # Same bounds as the settings dialog; also rejects inf/nan from a hand-edited file
+        if DatabaseManager.MIN_MAX_SESSION_HOURS <= hours <= DatabaseManager.MAX_MAX_SESSION_HOURS:
+            return hours
+        return DatabaseManager.DEFAULT_MAX_SESSION_HOURS
+
+    def save_max_session_hours(self, hours):
+        """Saves the max session hours to the config file."""
+        lines = self._read_lines()
+        lines[1] = str(hours)
+        self._write_lines(lines)
 
 
 class DatabaseManager:
     """处理所有数据库操作"""
 
-    def __init__(self, db_path=None):
+    # 异常日类型（位掩码），存放在 anomaly_day 索引表中
+    ANOMALY_MISSING_PUNCH = 1
+    ANOMALY_LONG_SESSION = 2
+    ANOMALY_DUPLICATE_PUNCH = 4
+    ANOMALY_LABELS = (
+        (ANOMALY_MISSING_PUNCH, "漏打卡"),
+        (ANOMALY_LONG_SESSION, "超长工时段"),
+        (ANOMALY_DUPLICATE_PUNCH, "重复打卡"),
+    )
+    DEFAULT_MAX_SESSION_HOURS = 12
+    MIN_MAX_SESSION_HOURS = 0.5
+    MAX_MAX_SESSION_HOURS = 24
+    DUPLICATE_PUNCH_SECONDS = 60  # 两次打卡间隔小于该值视为重复/重叠打卡
+
+    def __init__(self, db_path=None, max_session_hours=DEFAULT_MAX_SESSION_HOURS):
         final_db_path = db_path
 
         # If no valid path is provided, fall back to the default 'work_log.db'
@@ -51,10 +92,12 @@ class DatabaseManager:
             final_db_path = os.path.join(base_path, 'work_log.db')
 
         self.db_path = final_db_path
+        self.max_session_hours = max_session_hours
         try:
             self.conn = sqlite3.connect(self.db_path)
             self.cursor = self.conn.cursor()
             self.create_table()
+            self.create_anomaly_index()
             print(f"Successfully connected to database: {self.db_path}")
         except sqlite3.Error as e:
             messagebox.showerror("Database Error", f"Could not connect to database at:\n{self.db_path}\n\nError: {e}")
@@ -80,6 +123,104 @@ class DatabaseManager:
                             ''')
         self.conn.commit()
 
+    def create_anomaly_index(self):
+        """创建异常日索引表；索引为新建、超长阈值变化或 time_log 被外部修改时全量重建"""
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS anomaly_day (day TEXT PRIMARY KEY, flags INTEGER NOT NULL)")
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.cursor.execute("SELECT key, value FROM meta WHERE key IN ('max_session_hours', 'time_log_fingerprint')")
+        meta = dict(self.cursor.fetchall())
+        try:
+            stale = float(meta['max_session_hours']) != float(self.max_session_hours)
+        except (KeyError, ValueError):
+            stale = True  # 索引为新建，或 meta 中的值无法解析
+        # 旧版本程序或其它工具写入 time_log 后，指纹将不再匹配
+        if stale or meta.get('time_log_fingerprint') != self.time_log_fingerprint():
+            self.rebuild_anomaly_index()
+
+    def time_log_fingerprint(self):
+        """time_log 的简单指纹（记录数:最大 id），用于发现绕过本程序的修改"""
+        self.cursor.execute("SELECT COUNT(*), MAX(id) FROM time_log")
+        count, max_id = self.cursor.fetchone()
+        return f"{count}:{max_id}"
+
+    def save_time_log_fingerprint(self):
+        """保存当前 time_log 指纹（不提交事务）"""
+        self.cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('time_log_fingerprint', ?)",
+                            (self.time_log_fingerprint(),))
+
+    def rebuild_anomaly_index(self):
+        """根据全部打卡记录重建异常日索引"""
+        self.cursor.execute("SELECT checkpoint FROM time_log ORDER BY checkpoint ASC")
+        daily_data = {}
+        for row in self.cursor.fetchall():
+            cp = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+            daily_data.setdefault(cp.date(), []).append(cp)
+
+        rows = []
+        for day, checkpoints in daily_data.items():
+            flags = self.compute_anomaly_flags(checkpoints)
+            if flags:
+                rows.append((day.strftime('%Y-%m-%d'), flags))
+
+        self.cursor.execute("DELETE FROM anomaly_day")
+        self.cursor.executemany("INSERT INTO anomaly_day (day, flags) VALUES (?, ?)", rows)
+        self.cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('max_session_hours', ?)",
+                            (str(self.max_session_hours),))
+        self.save_time_log_fingerprint()
+        self.conn.commit()
+
+    def set_max_session_hours(self, hours):
+        """修改超长工时段阈值并重建异常日索引"""
+        self.max_session_hours = hours
+        self.rebuild_anomaly_index()
+
+    def compute_anomaly_flags(self, checkpoints):
+        """根据某一天按时间排序的时间点计算异常类型"""
+        flags = 0
+        if len(checkpoints) % 2 != 0:
+            flags |= self.ANOMALY_MISSING_PUNCH
+        max_session = timedelta(hours=self.max_session_hours)
+        for i in range(0, len(checkpoints) - 1, 2):
+            if checkpoints[i + 1] - checkpoints[i] > max_session:
+                flags |= self.ANOMALY_LONG_SESSION
+        for prev_cp, cp in zip(checkpoints, checkpoints[1:]):
+            if (cp - prev_cp).total_seconds() < self.DUPLICATE_PUNCH_SECONDS:
+                flags |= self.ANOMALY_DUPLICATE_PUNCH
+        return flags
+
+    def refresh_anomaly_day(self, target_date):
+        """重新计算指定日期的异常状态并更新索引（不提交事务）"""
+        flags = self.compute_anomaly_flags(self.get_checkpoints_for_day(target_date))
+        date_str = target_date.strftime('%Y-%m-%d')
+        if flags:
+            self.cursor.execute("INSERT OR REPLACE INTO anomaly_day (day, flags) VALUES (?, ?)", (date_str, flags))
+        else:
+            self.cursor.execute("DELETE FROM anomaly_day WHERE day = ?", (date_str,))
+        self.save_time_log_fingerprint()
+
+    def get_anomaly_flags(self, target_date):
+        """获取指定日期的异常类型，正常则返回 0"""
+        self.cursor.execute("SELECT flags FROM anomaly_day WHERE day = ?", (target_date.strftime('%Y-%m-%d'),))
+        row = self.cursor.fetchone()
+        return row[0] if row else 0
+
+    def get_adjacent_anomaly_day(self, from_date, forward=True):
+        """获取 from_date 之后（或之前）最近的异常日，返回 (date, flags)，没有则返回 (None, 0)"""
+        if forward:
+            query = "SELECT day, flags FROM anomaly_day WHERE day > ? ORDER BY day ASC LIMIT 1"
+        else:
+            query = "SELECT day, flags FROM anomaly_day WHERE day < ? ORDER BY day DESC LIMIT 1"
+        self.cursor.execute(query, (from_date.strftime('%Y-%m-%d'),))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None, 0
+        return datetime.strptime(row[0], '%Y-%m-%d').date(), row[1]
+
+    @classmethod
+    def describe_anomaly(cls, flags):
+        """将异常类型转换为可读文本"""
+        return "、".join(label for flag, label in cls.ANOMALY_LABELS if flags & flag)
+
     def add_checkpoint(self, dt_obj=None):
         """添加一个新的时间戳检查点"""
         if dt_obj is None:
@@ -87,6 +228,7 @@ class DatabaseManager:
         dt_string = dt_obj.strftime('%Y-%m-%d %H:%M:%S')
         try:
             self.cursor.execute("INSERT INTO time_log (checkpoint) VALUES (?)", (dt_string,))
+            self.refresh_anomaly_day(dt_obj.date())
             self.conn.commit()
             return True
         except sqlite3.IntegrityError:
@@ -96,10 +238,11 @@ class DatabaseManager:
 
     def get_checkpoints_for_day(self, target_date):
         """获取指定日期的所有检查点"""
-        date_str = target_date.strftime('%Y-%m-%d')
-        self.cursor.execute(
-            "SELECT checkpoint FROM time_log WHERE strftime('%Y-%m-%d', checkpoint) = ? ORDER BY checkpoint ASC",
-            (date_str,))
+        # 使用范围查询，以便利用 checkpoint 列上的 UNIQUE 索引
+        start_str = target_date.strftime('%Y-%m-%d 00:00:00')
+        end_str = target_date.strftime('%Y-%m-%d 23:59:59')
+        self.cursor.execute("SELECT checkpoint FROM time_log WHERE checkpoint BETWEEN ? AND ? ORDER BY checkpoint ASC",
+                            (start_str, end_str))
         return [datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S') for row in self.cursor.fetchall()]
 
     def get_checkpoints_for_range(self, start_date, end_date):
@@ -110,12 +253,41 @@ class DatabaseManager:
                             (start_str, end_str))
         return [datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S') for row in self.cursor.fetchall()]
 
+    def get_daily_summary_for_range(self, start_date, end_date):
+        """用一次查询汇总指定日期范围内每天的工作秒数和异常类型 {date: (seconds, flags)}"""
+        start_str = start_date.strftime('%Y-%m-%d 00:00:00')
+        end_str = end_date.strftime('%Y-%m-%d 23:59:59')
+        # 按天编号后两两配对：偶数位(下班)加、奇数位(上班)减，奇数个点时忽略最后一个未配对的点
+        self.cursor.execute('''
+                            WITH cp AS (SELECT date(checkpoint)                                       AS day,
+                                               CAST(strftime('%s', checkpoint) AS INTEGER)            AS ts,
+                                               ROW_NUMBER() OVER (PARTITION BY date(checkpoint)
+                                                   ORDER BY checkpoint)                               AS rn,
+                                               COUNT(*) OVER (PARTITION BY date(checkpoint))          AS n
+                                        FROM time_log
+                                        WHERE checkpoint BETWEEN ? AND ?)
+                            SELECT cp.day,
+                                   SUM(CASE
+                                           WHEN rn > n - n % 2 THEN 0
+                                           WHEN rn % 2 = 0 THEN ts
+                                           ELSE -ts END),
+                                   COALESCE(MAX(a.flags), 0)
+                            FROM cp
+                                     LEFT JOIN anomaly_day a ON a.day = cp.day
+                            GROUP BY cp.day
+                            ''', (start_str, end_str))
+        return {datetime.strptime(day, '%Y-%m-%d').date(): (seconds, flags)
+                for day, seconds, flags in self.cursor.fetchall()}
+
     def delete_checkpoint(self, dt_obj):
         """删除一个指定的时间点"""
         dt_string = dt_obj.strftime('%Y-%m-%d %H:%M:%S')
         self.cursor.execute("DELETE FROM time_log WHERE checkpoint = ?", (dt_string,))
+        deleted = self.cursor.rowcount > 0
+        if deleted:
+            self.refresh_anomaly_day(dt_obj.date())
         self.conn.commit()
-        return self.cursor.rowcount > 0
+        return deleted
 
     def close(self):
         """关闭数据库连接"""
@@ -153,6 +325,7 @@ class TimeTrackerApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Select Database...", command=self.select_database_file)
         file_menu.add_command(label="Show Database Path", command=self.show_database_path)
+        file_menu.add_command(label="Max Session Hours...", command=self.set_max_session_hours)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.clean_up_on_exit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -202,6 +375,19 @@ class TimeTrackerApp:
             f"当前数据库文件位置:\n{self.db.db_path}"
         )
 
+    def set_max_session_hours(self):
+        """设置超长工时段阈值（小时），保存到配置文件并重建异常日索引"""
+        hours = simpledialog.askfloat("超长工时段", "单段工时超过多少小时视为异常:",
+                                      initialvalue=self.db.max_session_hours,
+                                      minvalue=DatabaseManager.MIN_MAX_SESSION_HOURS,
+                                      maxvalue=DatabaseManager.MAX_MAX_SESSION_HOURS, parent=self.root)
+        if hours is None or hours == self.db.max_session_hours:
+            return
+        self.config.save_max_session_hours(hours)
+        self.db.set_max_session_hours(hours)
+        if self.stats_window and self.stats_window.winfo_exists():
+            self.stats_window.generate_report()
+
     def reload_with_new_database(self, new_db_path):
         """Closes the old DB, opens a new one, and refreshes the entire application state."""
         print("Reloading application with new database...")
@@ -221,7 +407,8 @@ class TimeTrackerApp:
 
         # 4. Connect to the new database
         try:
-            self.db = DatabaseManager(db_path=new_db_path)
+            self.db = DatabaseManager(db_path=new_db_path,
+                                      max_session_hours=self.config.load_max_session_hours())
             messagebox.showinfo(
                 "Database Changed",
                 f"Successfully loaded database:\n{os.path.basename(new_db_path)}"
@@ -229,7 +416,8 @@ class TimeTrackerApp:
         except ConnectionError:
             # If the new DB is invalid, try to revert to the previous one.
             messagebox.showerror("Error", f"Could not load the selected database. Reverting to the previous one.")
-            self.db = DatabaseManager(db_path=self.db.db_path)  # Reconnect to old DB
+            self.db = DatabaseManager(db_path=self.db.db_path,
+                                      max_session_hours=self.config.load_max_session_hours())  # Reconnect to old DB
 
         # 5. Refresh the main UI with data from the new database
         self.load_initial_state()
@@ -410,7 +598,7 @@ class ManualEntryWindow:
         parent.update_idletasks()
         parent_x, parent_y = parent.winfo_x(), parent.winfo_y()
         parent_width = parent.winfo_width()
-        win_width, win_height = 400, 450
+        win_width, win_height = 400, 490
         new_x = parent_x + parent_width + 10
         new_y = parent_y
         self.win.geometry(f"{win_width}x{win_height}+{new_x}+{new_y}")
@@ -431,6 +619,15 @@ class ManualEntryWindow:
         ttk.Button(date_frame, text="...", command=self.open_datepicker, width=3).pack(side='left', padx=(5, 0))
         ttk.Button(date_frame, text="加载", command=self.load_checkpoints).pack(side='left', padx=(10, 0))
 
+        nav_frame = ttk.Frame(frame)
+        nav_frame.pack(fill='x', pady=(5, 0))
+        ttk.Button(nav_frame, text="< 上一异常日",
+                   command=lambda: self.jump_to_anomaly(forward=False)).pack(side='left')
+        ttk.Button(nav_frame, text="下一异常日 >",
+                   command=lambda: self.jump_to_anomaly(forward=True)).pack(side='right')
+        self.anomaly_label = ttk.Label(nav_frame, text="", foreground="orange", anchor="center")
+        self.anomaly_label.pack(side='left', expand=True, fill='x')
+
         info_text = "说明：将按时间顺序两两配对（上班-下班）来计算总工时。"
         info_label = ttk.Label(frame, text=info_text, foreground="gray", wraplength=350, justify='left')
         info_label.pack(fill='x', pady=(10, 0))
@@ -467,9 +664,25 @@ class ManualEntryWindow:
             self.checkpoints = self.db.get_checkpoints_for_day(self.target_date)
             for cp in self.checkpoints:
                 self.checkpoints_listbox.insert(tk.END, cp.strftime('%Y-%m-%d %H:%M:%S'))
+            flags = self.db.get_anomaly_flags(self.target_date)
+            self.anomaly_label.config(text=self.db.describe_anomaly(flags))
         except ValueError:
             messagebox.showerror("错误", "日期格式不正确，应为 YYYY-MM-DD")
 
+    def jump_to_anomaly(self, forward=True):
+        """跳转到上一个/下一个异常日"""
+        try:
+            from_date = datetime.strptime(self.date_entry.get(), '%Y-%m-%d').date()
+        except ValueError:
+            from_date = date.today()
+        anomaly_date, _ = self.db.get_adjacent_anomaly_day(from_date, forward)
+        if anomaly_date is None:
+            messagebox.showinfo("提示", "没有更多异常日了。", parent=self.win)
+            return
+        self.date_entry.delete(0, tk.END)
+        self.date_entry.insert(0, anomaly_date.strftime('%Y-%m-%d'))
+        self.load_checkpoints()
+
     def add_checkpoint(self):
         """添加一个新的时间点"""
         new_time_str = simpledialog.askstring("添加时间点", "请输入时间 (HH:MM:SS):", parent=self.win)
@@ -534,6 +747,131 @@ class ManualEntryWindow:
                 messagebox.showerror("错误", "删除失败。")
 
 
+class HeatmapCanvas(tk.Canvas):
+    """在单个 Canvas 上绘制按年排列的每日工时热力图"""
+
+    CELL_SIZE = 10
+    CELL_GAP = 2
+    LEFT_MARGIN = 24
+    YEAR_TITLE_HEIGHT = 18
+    YEAR_SPACING = 10
+    EMPTY_COLOR = '#ebedf0'
+    # (最少小时数, 颜色)，按从高到低的顺序匹配
+    LEVEL_COLORS = ((8, '#196127'), (6, '#239a3b'), (4, '#7bc96f'), (0, '#c6e48b'))
+    ANOMALY_OUTLINE = 'orange'
+
+    def __init__(self, parent, db_manager, on_hover=None, on_open=None, **kwargs):
+        step = self.CELL_SIZE + self.CELL_GAP
+        kwargs.setdefault('width', self.LEFT_MARGIN + 54 * step)
+        kwargs.setdefault('background', 'white')
+        kwargs.setdefault('highlightthickness', 0)
+        super().__init__(parent, **kwargs)
+        self.db = db_manager
+        self.on_hover = on_hover
+        self.on_open = on_open
+
+        self.years = []
+        self.day_values = {}  # 日期 -> (seconds, flags)
+        self.day_items = {}  # 日期 -> 矩形 id
+        self.item_days = {}  # 矩形 id -> 日期
+
+        self.tag_bind('cell', '<Enter>', self.on_cell_enter)
+        self.tag_bind('cell', '<Leave>', self.on_cell_leave)
+        self.tag_bind('cell', '<Double-1>', self.on_cell_double_click)
+        self.bind('<MouseWheel>', lambda e: self.yview_scroll(int(-e.delta / 120), 'units'))
+        self.bind('<Button-4>', lambda e: self.yview_scroll(-1, 'units'))
+        self.bind('<Button-5>', lambda e: self.yview_scroll(1, 'units'))
+
+    def show_years(self, years):
+        """显示指定年份；年份不变时只更新数据有变化的格子"""
+        years = sorted(years, reverse=True)
+        if years == self.years:
+            self.refresh()
+        else:
+            self.years = years
+            self.redraw()
+
+    def load_year(self, year):
+        """每年一次查询获取每日汇总数据"""
+        return self.db.get_daily_summary_for_range(date(year, 1, 1), date(year, 12, 31))
+
+    def redraw(self):
+        """清空并重新绘制所有年份"""
+        self.delete('all')
+        self.day_values, self.day_items, self.item_days = {}, {}, {}
+        step = self.CELL_SIZE + self.CELL_GAP
+        year_height = self.YEAR_TITLE_HEIGHT + 7 * step + self.YEAR_SPACING
+
+        for n, year in enumerate(self.years):
+            top = n * year_height
+            grid_top = top + self.YEAR_TITLE_HEIGHT
+            self.create_text(self.LEFT_MARGIN, top + 2, anchor='nw', text=f"{year} 年", font=('Helvetica', 9, 'bold'))
+            for row, label in ((0, '一'), (2, '三'), (4, '五')):
+                self.create_text(self.LEFT_MARGIN - 6, grid_top + row * step + self.CELL_SIZE // 2,
+                                 anchor='e', text=label, font=('Helvetica', 7), fill='gray')
+
+            summary = self.load_year(year)
+            first_day = date(year, 1, 1)
+            offset = first_day.weekday()
+            days_in_year = 366 if calendar.isleap(year) else 365
+            for i in range(days_in_year):
+                day = first_day + timedelta(days=i)
+                col, row = divmod(i + offset, 7)
+                x = self.LEFT_MARGIN + col * step
+                y = grid_top + row * step
+                value = summary.get(day, (0, 0))
+                fill, outline = self.cell_colors(value)
+                item_id = self.create_rectangle(x, y, x + self.CELL_SIZE, y + self.CELL_SIZE,
+                                                fill=fill, outline=outline, tags=('cell',))
+                self.day_values[day] = value
+                self.day_items[day] = item_id
+                self.item_days[item_id] = day
+
+        self.configure(scrollregion=(0, 0, int(self['width']), len(self.years) * year_height))
+
+    def refresh(self):
+        """重新查询数据，只更新发生变化的格子"""
+        for year in self.years:
+            summary = self.load_year(year)
+            first_day = date(year, 1, 1)
+            days_in_year = 366 if calendar.isleap(year) else 365
+            for i in range(days_in_year):
+                day = first_day + timedelta(days=i)
+                value = summary.get(day, (0, 0))
+                if value != self.day_values.get(day):
+                    fill, outline = self.cell_colors(value)
+                    self.itemconfigure(self.day_items[day], fill=fill, outline=outline)
+                    self.day_values[day] = value
+
+    def cell_colors(self, value):
+        """根据工作秒数和异常类型返回 (填充色, 边框色)"""
+        seconds, flags = value
+        fill = self.EMPTY_COLOR
+        if seconds > 0:
+            hours = seconds / 3600
+            fill = next(color for min_hours, color in self.LEVEL_COLORS if hours >= min_hours)
+        return fill, (self.ANOMALY_OUTLINE if flags else '')
+
+    def current_day(self):
+        """返回鼠标当前所在格子的日期"""
+        items = self.find_withtag('current')
+        return self.item_days.get(items[0]) if items else None
+
+    def on_cell_enter(self, event):
+        day = self.current_day()
+        if day is not None and self.on_hover:
+            self.on_hover(day, self.day_values[day])
+
+    def on_cell_leave(self, event):
+        if self.on_hover:
+            self.on_hover(None, None)
+
+    def on_cell_double_click(self, event):
+        day = self.current_day()
+        if day is not None and self.on_open:
+            self.on_open(day)
+
+
 class StatsWindow(tk.Toplevel):
     """统计数据窗口"""
 
@@ -543,14 +881,6 @@ class StatsWindow(tk.Toplevel):
         self.transient(parent)
         self.title("工时统计")
 
-        parent.update_idletasks()
-        parent_x, parent_y = parent.winfo_x(), parent.winfo_y()
-        parent_width = parent.winfo_width()
-        win_width, win_height = 500, 400
-        new_x = parent_x + parent_width + 10
-        new_y = parent_y
-        self.geometry(f"{win_width}x{win_height}+{new_x}+{new_y}")
-
         self.app = app
         self.db = db_manager
         self.formatter = formatter
@@ -572,18 +902,57 @@ class StatsWindow(tk.Toplevel):
         self.end_date_entry.pack(side='left', padx=5)
         ttk.Button(date_range_frame, text="生成报告", command=self.generate_report).pack(side='left', padx=10)
 
-        tree_frame = ttk.Frame(frame)
-        tree_frame.pack(expand=True, fill='both', pady=10)
+        body_frame = ttk.Frame(frame)
+        body_frame.pack(expand=True, fill='both', pady=10)
+        left_frame = ttk.Frame(body_frame)
+        left_frame.pack(side='left', expand=True, fill='both')
+
+        tree_frame = ttk.Frame(left_frame)
+        tree_frame.pack(expand=True, fill='both', pady=(0, 10))
         self.tree = ttk.Treeview(tree_frame, columns=('date', 'hours'), show='headings')
         self.tree.heading('date', text='日期')
         self.tree.heading('hours', text='总工时')
+        self.tree.column('date', width=100)
+        self.tree.column('hours', width=200)
         vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
         self.tree.configure(yscrollcommand=vsb.set)
         vsb.pack(side='right', fill='y')
         self.tree.pack(side='left', expand=True, fill='both')
         self.tree.bind("<Double-1>", self.on_date_double_click)
-        self.tree.tag_configure('missing_punch', foreground='orange', font=('Helvetica', 9, 'italic'))
+        self.tree.tag_configure('anomaly', foreground='orange', font=('Helvetica', 9, 'italic'))
         self.tree.tag_configure('total', font=('Helvetica', 10, 'bold'))
+        self.day_items = {}  # 日期 -> Treeview 条目 id，用于异常日快速定位
+
+        nav_frame = ttk.Frame(left_frame)
+        nav_frame.pack(fill='x')
+        ttk.Button(nav_frame, text="< 上一异常日",
+                   command=lambda: self.jump_to_anomaly(forward=False)).pack(side='left')
+        ttk.Button(nav_frame, text="下一异常日 >",
+                   command=lambda: self.jump_to_anomaly(forward=True)).pack(side='right')
+
+        # --- 日历热力图 ---
+        heatmap_frame = ttk.Frame(body_frame)
+        heatmap_frame.pack(side='right', fill='both', padx=(15, 0))
+        self.heatmap_info_label = ttk.Label(heatmap_frame, text="", foreground="gray")
+        self.heatmap_info_label.pack(side='bottom', fill='x', pady=(5, 0))
+        self.heatmap = HeatmapCanvas(heatmap_frame, self.db, on_hover=self.on_heatmap_hover, on_open=self.open_date)
+        heatmap_vsb = ttk.Scrollbar(heatmap_frame, orient="vertical", command=self.heatmap.yview)
+        heatmap_hsb = ttk.Scrollbar(heatmap_frame, orient="horizontal", command=self.heatmap.xview)
+        self.heatmap.configure(yscrollcommand=heatmap_vsb.set, xscrollcommand=heatmap_hsb.set)
+        heatmap_hsb.pack(side='bottom', fill='x')
+        heatmap_vsb.pack(side='right', fill='y')
+        self.heatmap.pack(side='left', expand=True, fill='both')
+
+        # 按内容所需宽度确定窗口大小，屏幕放不下时缩窄（热力图可横向滚动）并向左移动
+        parent.update_idletasks()
+        self.update_idletasks()
+        parent_x, parent_y = parent.winfo_x(), parent.winfo_y()
+        parent_width = parent.winfo_width()
+        screen_width = self.winfo_screenwidth()
+        win_width, win_height = min(self.winfo_reqwidth(), screen_width), 420
+        new_x = max(0, min(parent_x + parent_width + 10, screen_width - win_width))
+        new_y = parent_y
+        self.geometry(f"{win_width}x{win_height}+{new_x}+{new_y}")
 
         self.generate_report()
         self.deiconify()
@@ -600,18 +969,34 @@ class StatsWindow(tk.Toplevel):
         try:
             # 尝试解析日期以确保它是一个有效的日期行（而不是总计行）
             target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            # 传入 self 作为父窗口，确保修改窗口显示在统计窗口之上
-            self.app.open_manual_entry_window(parent_win=self, target_date=target_date)
-            # 修改窗口关闭后，刷新统计报告以显示最新数据
-            self.generate_report()
         except (ValueError, IndexError):
             # 如果点击的是总计行或标题行，则会解析失败，不做任何事
-            pass
+            return
+        self.open_date(target_date)
+
+    def open_date(self, target_date):
+        """打开指定日期的修改窗口"""
+        # 传入 self 作为父窗口，确保修改窗口显示在统计窗口之上
+        self.app.open_manual_entry_window(parent_win=self, target_date=target_date)
+        # 修改窗口关闭后，刷新统计报告以显示最新数据
+        self.generate_report()
+
+    def on_heatmap_hover(self, day, value):
+        """鼠标悬停在热力图格子上时显示当日工时"""
+        if day is None:
+            self.heatmap_info_label.config(text="")
+            return
+        seconds, flags = value
+        text = f"{day.strftime('%Y-%m-%d')}  {self.formatter(seconds)}"
+        if flags:
+            text += f" ({self.db.describe_anomaly(flags)})"
+        self.heatmap_info_label.config(text=text)
 
     def generate_report(self):
         """生成并显示统计报告"""
         for i in self.tree.get_children():
             self.tree.delete(i)
+        self.day_items = {}
         last_item_id = None
         try:
             start_date = datetime.strptime(self.start_date_entry.get(), '%Y-%m-%d').date()
@@ -622,29 +1007,25 @@ class StatsWindow(tk.Toplevel):
         if start_date > end_date:
             messagebox.showerror("错误", "开始日期不能晚于结束日期。", parent=self)
             return
+        self.heatmap.show_years(range(start_date.year, end_date.year + 1))
 
-        all_checkpoints = self.db.get_checkpoints_for_range(start_date, end_date)
-        daily_data = {}
-        for cp in all_checkpoints:
-            day = cp.date()
-            if day not in daily_data:
-                daily_data[day] = []
-            daily_data[day].append(cp)
+        # 与热力图使用同一份每日汇总，保证两者数据一致
+        daily_summary = self.db.get_daily_summary_for_range(start_date, end_date)
 
         total_seconds_all_days = 0
 
-        # 计算并显示每天的数据
-        for day, checkpoints in sorted(daily_data.items()):
-            total_seconds_day = self.calculate_worked_seconds_static(checkpoints)
+        # 显示每天的数据
+        for day, (total_seconds_day, flags) in sorted(daily_summary.items()):
             total_seconds_all_days += total_seconds_day
             display_hours = self.formatter(total_seconds_day)
             row_tags = ()
 
-            # 如果打卡次数为奇数，则标记为漏打卡
-            if len(checkpoints) % 2 != 0:
-                display_hours += " (漏打卡)"
-                row_tags = ('missing_punch',)
+            # 异常日（漏打卡、超长工时段、重复打卡）标注原因
+            if flags:
+                display_hours += f" ({self.db.describe_anomaly(flags)})"
+                row_tags = ('anomaly',)
             last_item_id = self.tree.insert('', 'end', values=(day.strftime('%Y-%m-%d'), display_hours), tags=row_tags)
+            self.day_items[day] = last_item_id
 
         # 显示总计
         last_item_id = self.tree.insert('', 'end', values=("--- 总计 ---", self.formatter(total_seconds_all_days)), tags=('total',))
@@ -653,13 +1034,51 @@ class StatsWindow(tk.Toplevel):
             self.tree.update_idletasks()
             self.tree.see(last_item_id)
 
-    @staticmethod
-    def calculate_worked_seconds_static(checkpoints):
-        """静态方法，用于计算秒数（统计窗口不需要知道当前状态）"""
-        total_seconds = 0
-        for i in range(0, len(checkpoints) - 1, 2):
-            total_seconds += (checkpoints[i + 1] - checkpoints[i]).total_seconds()
-        return total_seconds
+    def jump_to_anomaly(self, forward=True):
+        """选中上一个/下一个异常日，超出当前范围时保持范围长度不变、平移到该日期"""
+        from_date = None
+        selection = self.tree.selection()
+        if selection:
+            try:
+                from_date = datetime.strptime(self.tree.item(selection[0])['values'][0], '%Y-%m-%d').date()
+            except (ValueError, IndexError):
+                pass  # 选中的是总计行
+        if from_date is None:
+            try:
+                if forward:
+                    from_date = datetime.strptime(self.start_date_entry.get(), '%Y-%m-%d').date() - timedelta(days=1)
+                else:
+                    from_date = datetime.strptime(self.end_date_entry.get(), '%Y-%m-%d').date() + timedelta(days=1)
+            except ValueError:
+                from_date = date.today()
+
+        anomaly_date, _ = self.db.get_adjacent_anomaly_day(from_date, forward)
+        if anomaly_date is None:
+            messagebox.showinfo("提示", "没有更多异常日了。", parent=self)
+            return
+
+        if anomaly_date not in self.day_items:
+            try:
+                start_date = datetime.strptime(self.start_date_entry.get(), '%Y-%m-%d').date()
+                end_date = datetime.strptime(self.end_date_entry.get(), '%Y-%m-%d').date()
+                span = max(end_date - start_date, timedelta(0))
+                # 范围长度不变：向后跳转时异常日位于新范围开头，向前跳转时位于结尾
+                start_date = anomaly_date if forward else anomaly_date - span
+            except ValueError:
+                # 日期范围无效时，显示异常日所在的月份
+                span = timedelta(days=calendar.monthrange(anomaly_date.year, anomaly_date.month)[1] - 1)
+                start_date = anomaly_date.replace(day=1)
+            self.start_date_entry.delete(0, tk.END)
+            self.start_date_entry.insert(0, start_date.strftime('%Y-%m-%d'))
+            self.end_date_entry.delete(0, tk.END)
+            self.end_date_entry.insert(0, (start_date + span).strftime('%Y-%m-%d'))
+            self.generate_report()
+
+        item_id = self.day_items.get(anomaly_date)
+        if item_id is not None:
+            self.tree.selection_set(item_id)
+            self.tree.focus(item_id)
+            self.tree.see(item_id)
 
 
 if __name__ == "__main__":
@@ -668,7 +1087,7 @@ if __name__ == "__main__":
     saved_db_path = config.load_db_path()
 
     try:
-        db = DatabaseManager(db_path=saved_db_path)
+        db = DatabaseManager(db_path=saved_db_path, max_session_hours=config.load_max_session_hours())
         app = TimeTrackerApp(app_root, db, config)
         app_root.mainloop()
     except ConnectionError: